@@ -0,0 +1,208 @@
+"""
+Multi-worker throughput benchmark
+WHY? Shows how requests/second scale when running `uvicorn --workers N`
+
+Usage (from the backend directory):
+    python benchmark_workers.py --max-workers 4 --duration 10 --workload write
+
+Starts the API once per worker count against a temporary database, sends
+requests from several client processes, and prints a table.
+
+Workloads:
+    read   GET /history (one SELECT per request)
+    write  POST /analyze with git and Gemini stubbed, so each request runs the
+           shared token budget (reserve + settle) and save_commit, i.e. three
+           SQLite writes that every worker competes for
+
+No real Gemini calls are made, so any GEMINI_API_KEY value works.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+import urllib.error
+import urllib.request
+
+STUB_MESSAGE = "fix: benchmark stub"
+
+
+class StubModel:
+    """Answers instantly, so the write workload measures the database, not Gemini"""
+
+    def generate_content(self, prompt, generation_config=None):
+        part = SimpleNamespace(text="TYPE: fix\nSUBJECT: benchmark stub\nBODY: ")
+        candidate = SimpleNamespace(content=SimpleNamespace(parts=[part]), finish_reason=1)
+        usage = SimpleNamespace(prompt_token_count=300, total_token_count=350)
+        return SimpleNamespace(candidates=[candidate], usage_metadata=usage)
+
+
+def create_stub_app():
+    """
+    App factory for the write workload (uvicorn --factory)
+
+    WHY a factory? Every worker process calls it, so each one gets the stubs
+    """
+    import main
+    from gemini_service import MODEL_TIERS
+
+    for config in MODEL_TIERS.values():
+        main.gemini_service._models[config["model"]] = StubModel()
+    main.git_analyzer.get_staged_changes = lambda repo_path: {
+        "has_changes": True,
+        "diff": "+x = 1\n" * 20,
+        "files": ["app.py"],
+        "insertions": 20,
+        "deletions": 0
+    }
+    return main.app
+
+
+def wait_for_server(url: str, timeout: float = 30) -> bool:
+    """Poll the health check until the server answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.2)
+    return False
+
+
+def send(url: str, workload: str) -> bool:
+    """Send one request; False if the server answered with a fallback message"""
+    if workload == "write":
+        request = urllib.request.Request(
+            url, data=b"{}", headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return STUB_MESSAGE.encode() in response.read()
+
+    with urllib.request.urlopen(url, timeout=30) as response:
+        response.read()
+    return True
+
+
+def client(url: str, workload: str, duration: float, results) -> None:
+    """
+    Send requests in a loop for `duration` seconds
+
+    WHY a process, not a thread? A threaded client would hit the GIL and
+    measure itself instead of the server
+    """
+    ok = 0
+    errors = 0
+    fallbacks = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        try:
+            if send(url, workload):
+                ok += 1
+            else:
+                fallbacks += 1
+        except Exception:
+            errors += 1
+    results.put((ok, errors, fallbacks))
+
+
+def run_benchmark(workload: str, workers: int, port: int, clients: int,
+                  duration: float, db_path: str) -> dict:
+    """Start the server with `workers` processes and measure throughput"""
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    env["DATABASE_PATH"] = db_path
+    # WHY so high? The write workload should hit the budget table, not the limit
+    env["GEMINI_TOKENS_PER_MINUTE"] = str(10 ** 12)
+
+    if workload == "write":
+        app_args = ["benchmark_workers:create_stub_app", "--factory"]
+        path = "/analyze"
+    else:
+        app_args = ["main:app"]
+        path = "/history?limit=10"
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *app_args,
+         "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        if not wait_for_server(base_url + "/"):
+            raise RuntimeError(f"Server with {workers} worker(s) did not start")
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=client, args=(base_url + path, workload, duration, results)
+            )
+            for _ in range(clients)
+        ]
+        for process in processes:
+            process.start()
+
+        ok = 0
+        errors = 0
+        fallbacks = 0
+        for _ in processes:
+            process_ok, process_errors, process_fallbacks = results.get()
+            ok += process_ok
+            errors += process_errors
+            fallbacks += process_fallbacks
+        for process in processes:
+            process.join()
+
+        return {
+            "workers": workers,
+            "requests": ok,
+            "errors": errors,
+            "fallbacks": fallbacks,
+            "rps": ok / duration
+        }
+
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--workload", choices=["read", "write"], default="write")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent client processes")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per run")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "benchmark.db")
+
+        # Seed some history so /history does real work
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from database import Database
+        db = Database(db_path)
+        for i in range(50):
+            db.save_commit(f"chore: seed commit {i}", "chore", [f"file_{i}.py"])
+
+        rows = []
+        for workers in range(1, args.max_workers + 1):
+            rows.append(run_benchmark(args.workload, workers, args.port, args.clients,
+                                      args.duration, db_path))
+
+    baseline = rows[0]["rps"] or 1
+    print(f"\n{args.workload} workload, {os.cpu_count()} CPU core(s)")
+    print(f"{'workers':>8} {'requests':>10} {'errors':>8} {'fallbacks':>10} {'req/s':>10} {'speedup':>8}")
+    for row in rows:
+        print(f"{row['workers']:>8} {row['requests']:>10} {row['errors']:>8} {row['fallbacks']:>10} "
+              f"{row['rps']:>10.1f} {row['rps'] / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
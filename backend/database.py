@@ -4,10 +4,39 @@ WHY database? Store history of generated commits for reference
 """
 import sqlite3
 import json
+import time
+import functools
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
 
+# How long a connection waits for another process to release a lock
+# WHY? With `uvicorn --workers N` every worker writes to the same file
+BUSY_TIMEOUT_SECONDS = float(os.getenv("DATABASE_BUSY_TIMEOUT", "5"))
+
+# Extra attempts when the busy timeout still runs out
+LOCK_RETRIES = 3
+
+
+def retry_on_lock(method):
+    """
+    Retry a Database method when SQLite reports the file is locked
+
+    WHY? Under heavy load the busy timeout alone can still expire
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                return method(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                message = str(e).lower()
+                if attempt == LOCK_RETRIES or ("locked" not in message and "busy" not in message):
+                    raise
+                # Back off a little longer each time
+                time.sleep(0.05 * (2 ** attempt))
+    return wrapper
+
 class Database:
     """Manages SQLite database for commit history"""
 
@@ -23,17 +52,38 @@ class Database:
             os.makedirs(db_dir)
 
         self.db_path = db_path
+        self.busy_timeout = BUSY_TIMEOUT_SECONDS
         self._create_tables()
 
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open a connection that waits for locks instead of failing at once
+
+        WHY timeout? sqlite3 sets SQLite's busy timeout from it
+        """
+        return sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+
+    @retry_on_lock
     def _create_tables(self):
         """
         Create database tables if they don't exist
 
         WHY migration? Sets up schema on first run
+        WHY BEGIN IMMEDIATE? With --workers N every worker runs this at startup;
+        the write lock makes checking and adding columns one step
         """
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._connect()
+        conn.isolation_level = None  # We manage the transaction ourselves
+        try:
             cursor = conn.cursor()
 
+            # WAL lets readers keep going while another worker writes
+            # WHY here? journal_mode is stored in the file, so once is enough
+            # (and it can't be changed inside a transaction)
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+            cursor.execute("BEGIN IMMEDIATE")
+
             # Commits table - stores generated commit messages
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS commits (
@@ -42,10 +92,29 @@ class Database:
                     commit_type TEXT NOT NULL,
                     files TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    used BOOLEAN DEFAULT FALSE
+                    used BOOLEAN DEFAULT FALSE,
+                    model TEXT,
+                    routing_tier TEXT,
+                    prompt_tokens INTEGER,
+                    estimated_cost REAL,
+                    fallback BOOLEAN DEFAULT FALSE
                 )
             """)
 
+            # Add routing columns to databases created before they existed
+            # WHY? CREATE TABLE IF NOT EXISTS won't touch an existing table
+            cursor.execute("PRAGMA table_info(commits)")
+            existing_columns = {row[1] for row in cursor.fetchall()}
+            for column, column_type in [
+                ("model", "TEXT"),
+                ("routing_tier", "TEXT"),
+                ("prompt_tokens", "INTEGER"),
+                ("estimated_cost", "REAL"),
+                ("fallback", "BOOLEAN DEFAULT FALSE"),
+            ]:
+                if column not in existing_columns:
+                    cursor.execute(f"ALTER TABLE commits ADD COLUMN {column} {column_type}")
+
             # Settings table - store user preferences
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS settings (
@@ -54,16 +123,46 @@ class Database:
                 )
             """)
 
-            conn.commit()
+            # Token usage table - per-minute budget shared by all workers
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS token_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL,
+                    tokens INTEGER NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_token_usage_created_at
+                ON token_usage (created_at)
+            """)
+
+            cursor.execute("COMMIT")
+
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
 
-    def save_commit(self, message: str, commit_type: str, files: List[str]) -> int:
+        finally:
+            conn.close()
+
+    @retry_on_lock
+    def save_commit(self, message: str, commit_type: str, files: List[str],
+                    routing: Optional[Dict] = None) -> int:
         """
         Save a generated commit message
 
         WHY? Keep history of what AI generated for future reference
+        WHY routing? Shows which model handled each diff and what it cost
         Returns: commit_id
         """
-        with sqlite3.connect(self.db_path) as conn:
+        routing = routing or {}
+
+        # WHY NULL model on fallback? No model wrote that message
+        fallback = bool(routing.get("fallback"))
+        model = None if fallback else routing.get("model")
+
+        with self._connect() as conn:
             cursor = conn.cursor()
 
             # Convert files list to JSON string for storage
@@ -71,26 +170,30 @@ class Database:
             files_json = json.dumps(files)
 
             cursor.execute("""
-                INSERT INTO commits (message, commit_type, files)
-                VALUES (?, ?, ?)
-            """, (message, commit_type, files_json))
+                INSERT INTO commits (message, commit_type, files, model, routing_tier,
+                                     prompt_tokens, estimated_cost, fallback)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (message, commit_type, files_json, model, routing.get("tier"),
+                  routing.get("prompt_tokens"), routing.get("estimated_cost"), fallback))
 
             conn.commit()
             return cursor.lastrowid
 
+    @retry_on_lock
     def get_recent_commits(self, limit: int = 10) -> List[Dict]:
         """
         Get recent commit history
 
         WHY? Show user what was generated before
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             # Enable row factory to get dict results
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
             cursor.execute("""
-                SELECT id, message, commit_type, files, created_at, used
+                SELECT id, message, commit_type, files, created_at, used,
+                       model, routing_tier, prompt_tokens, estimated_cost, fallback
                 FROM commits
                 ORDER BY created_at DESC
                 LIMIT ?
@@ -107,18 +210,24 @@ class Database:
                     "commit_type": row["commit_type"],
                     "files": json.loads(row["files"]),  # Parse JSON back to list
                     "created_at": row["created_at"],
-                    "used": bool(row["used"])
+                    "used": bool(row["used"]),
+                    "model": row["model"],
+                    "routing_tier": row["routing_tier"],
+                    "prompt_tokens": row["prompt_tokens"],
+                    "estimated_cost": row["estimated_cost"],
+                    "fallback": bool(row["fallback"])
                 })
 
             return commits
 
+    @retry_on_lock
     def mark_as_used(self, commit_id: int):
         """
         Mark a commit as used (actually committed to git)
 
         WHY? Track which AI suggestions were actually used
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute("""
@@ -129,13 +238,14 @@ class Database:
 
             conn.commit()
 
+    @retry_on_lock
     def get_stats(self) -> Dict:
         """
         Get usage statistics
 
         WHY? Show user insights: most common type, total commits, etc.
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
 
             # Total commits generated
@@ -163,13 +273,86 @@ class Database:
                 "most_common_type": most_common
             }
 
+    @retry_on_lock
     def clear_history(self):
         """
         Clear all commit history
 
         WHY? User might want fresh start
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM commits")
             conn.commit()
+
+    @retry_on_lock
+    def reserve_tokens(self, tokens: int, limit: int, window_seconds: int = 60) -> Optional[int]:
+        """
+        Count tokens against a budget shared by every worker process
+
+        WHY BEGIN IMMEDIATE? Takes the write lock first, so two workers
+        can't both read the same total and go over the limit together
+        Returns: reservation id, or None if the tokens don't fit in the budget
+        """
+        conn = self._connect()
+        conn.isolation_level = None  # We manage the transaction ourselves
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+
+            now = time.time()
+            cursor.execute(
+                "DELETE FROM token_usage WHERE created_at <= ?",
+                (now - window_seconds,)
+            )
+
+            cursor.execute("SELECT COALESCE(SUM(tokens), 0) FROM token_usage")
+            used = cursor.fetchone()[0]
+
+            if used + tokens > limit:
+                cursor.execute("ROLLBACK")
+                return None
+
+            cursor.execute(
+                "INSERT INTO token_usage (created_at, tokens) VALUES (?, ?)",
+                (now, tokens)
+            )
+            reservation_id = cursor.lastrowid
+            cursor.execute("COMMIT")
+            return reservation_id
+
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+        finally:
+            conn.close()
+
+    @retry_on_lock
+    def release_tokens(self, reservation_id: int):
+        """
+        Give back tokens reserved for a request that failed
+
+        WHY? A request that produced nothing shouldn't count against the budget
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM token_usage WHERE id = ?", (reservation_id,))
+            conn.commit()
+
+    @retry_on_lock
+    def settle_tokens(self, reservation_id: int, tokens: int):
+        """
+        Shrink a reservation to the tokens a successful request really used
+
+        WHY? Reservations count the whole output cap, which is far more than
+        a commit message needs; keeping that would starve the other workers
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE token_usage SET tokens = ? WHERE id = ?",
+                (tokens, reservation_id)
+            )
+            conn.commit()
@@ -2,18 +2,67 @@
 Google Gemini Flash Integration
 WHY Gemini? It's fast, free tier available, and good at code analysis
 """
+import asyncio
 import os
-from typing import Dict
+import time
+from collections import deque
+from typing import Dict, Optional
 import google.generativeai as genai
 
+# Model tiers, cheapest first
+# WHY tiers? A typo fix doesn't need the same model (or wait) as a big feature
+# Prices are USD per 1M tokens, used only for the cost estimate in history
+# WHY such high output caps? Gemini 2.5 flash and pro "think" first, and the
+# thinking tokens come out of max_output_tokens (pro can't turn it off).
+# The pinned SDK has no thinking budget setting, so the cap has to leave room.
+MODEL_TIERS = {
+    "lite": {
+        "model": "models/gemini-2.5-flash-lite",
+        "max_output_tokens": 1024,
+        "max_diff_chars": 2000,
+        "input_price": 0.10,
+        "output_price": 0.40,
+    },
+    "standard": {
+        "model": "models/gemini-2.5-flash",
+        "max_output_tokens": 8192,
+        "max_diff_chars": 6000,
+        "input_price": 0.30,
+        "output_price": 2.50,
+    },
+    "pro": {
+        "model": "models/gemini-2.5-pro",
+        "max_output_tokens": 16384,
+        "max_diff_chars": 20000,
+        "input_price": 1.25,
+        "output_price": 10.00,
+    },
+}
+
+# WHY 4? Rough average characters per token for English text and code
+CHARS_PER_TOKEN = 4
+
+# Diff size limits (in estimated tokens) for picking a tier
+# WHY derived? A diff routed to a tier must fit that tier's diff window,
+# otherwise it gets cut off while a slightly bigger one goes to pro in full
+LITE_MAX_DIFF_TOKENS = MODEL_TIERS["lite"]["max_diff_chars"] // CHARS_PER_TOKEN
+STANDARD_MAX_DIFF_TOKENS = MODEL_TIERS["standard"]["max_diff_chars"] // CHARS_PER_TOKEN
+
+
+class TokenBudgetError(Exception):
+    """Request doesn't fit the per-request or per-minute token budget"""
+
+
 class GeminiService:
     """Service for interacting with Google Gemini AI"""
 
-    def __init__(self):
+    def __init__(self, token_store=None):
         """
         Initialize Gemini API
 
         WHY environment variable? Keep API key secret, don't hardcode it
+        WHY token_store? An object with reserve_tokens() (e.g. Database) lets
+        every uvicorn worker share one per-minute budget
         """
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
@@ -24,9 +73,20 @@ class GeminiService:
 
         genai.configure(api_key=api_key)
 
-        # WHY gemini-2.5-flash? It's fast, free, and great for code analysis
-        # Using the correct model name from the available models list
-        self.model = genai.GenerativeModel('models/gemini-2.5-flash')
+        # One GenerativeModel per tier, created on first use
+        # WHY lazy? Most sessions only ever touch one or two tiers
+        self._models: Dict[str, genai.GenerativeModel] = {}
+
+        # Token budgets (estimated tokens, prompt + output cap)
+        # WHY budgets? Keep a big diff from burning the free-tier quota
+        self.max_request_tokens = int(os.getenv("GEMINI_MAX_REQUEST_TOKENS", "32000"))
+        self.tokens_per_minute = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "250000"))
+
+        # Shared budget store; falls back to this process's own window
+        self.token_store = token_store
+
+        # (timestamp, tokens) for requests sent in the last minute
+        self._token_window: deque = deque()
 
         # Commit message conventions (standardized format)
         self.commit_types = {
@@ -45,40 +105,281 @@ class GeminiService:
         Generate commit message from git diff
 
         WHY async? Doesn't block other operations while waiting for AI
+        WHY a thread? The Gemini call and the shared token budget (SQLite)
+        are blocking, so they run off the event loop
         """
+        return await asyncio.to_thread(self._generate, diff, files)
 
-        # Create prompt for Gemini
-        # WHY detailed prompt? Better prompts = better AI responses
-        prompt = self._create_prompt(diff, files)
+    def _generate(self, diff: str, files: list[str], style_instruction: Optional[str] = None) -> Dict:
+        """
+        Route, budget and send one request, falling back on any failure
+
+        WHY shared? generate_commit_message and regenerate_with_style must
+        handle budgets and errors the same way
+        """
+        # Pick model tier and prompt size for this diff
+        # WHY routing? Small changes get fast answers, large ones a stronger model
+        routing = self._select_route(diff, files)
+        reservation = None
 
         try:
+            # Create prompt for Gemini
+            # WHY detailed prompt? Better prompts = better AI responses
+            prompt = self._build_prompt(diff, files, routing, style_instruction)
+
+            reservation = self._reserve_tokens(routing["prompt_tokens"] + routing["max_output_tokens"])
+
             # Call Gemini API
-            response = self.model.generate_content(prompt)
+            response = self._get_model(routing["model"]).generate_content(
+                prompt,
+                generation_config={"max_output_tokens": routing["max_output_tokens"]}
+            )
+            response_text = self._response_text(response, routing["max_output_tokens"])
+
+            # Real token counts when Gemini reports them
+            # WHY only now? Routing and budgeting had to use the local estimate
+            prompt_tokens, output_tokens = self._usage_tokens(
+                response, routing["prompt_tokens"], response_text
+            )
+            routing["prompt_tokens"] = prompt_tokens
 
-            # Check if response has text (can be None if content is blocked or API error)
-            if not response or not hasattr(response, 'text'):
-                raise Exception("Empty response from Gemini API")
+            # WHY settle? The reservation counted the whole output cap, but a
+            # commit message is usually a few dozen tokens
+            reservation = self._settle_tokens(reservation, prompt_tokens + output_tokens)
 
             # Parse response
-            message_data = self._parse_response(response.text)
+            message_data = self._parse_response(response_text)
+            routing["estimated_cost"] = self._estimate_cost(routing["tier"], prompt_tokens, output_tokens)
+            message_data["routing"] = routing
 
             return message_data
 
         except Exception as e:
-            # Fallback if AI fails
+            # Fallback if AI fails (or the token budget is used up)
             print(f"Gemini API error: {e}")  # Log the error for debugging
+
+            # WHY release? A request that produced nothing shouldn't eat the budget
+            # WHY its own try? A failed release must not turn the fallback into a 500
+            if reservation is not None:
+                try:
+                    self._release_tokens(reservation)
+                except Exception as release_error:
+                    print(f"Token release error: {release_error}")
+
+            routing["fallback"] = True
+            routing["estimated_cost"] = 0.0
             return {
                 "type": "chore",
                 "subject": f"update {len(files)} file(s)",
                 "message": f"chore: update {len(files)} file(s)\n\nFiles: {', '.join(files)}",
-                "body": ""
+                "body": "",
+                "routing": routing
             }
 
-    def _create_prompt(self, diff: str, files: list[str]) -> str:
+    @staticmethod
+    def estimate_tokens(text: Optional[str]) -> int:
+        """
+        Estimate token count locally
+
+        WHY local? A count_tokens call is a full network round trip per request
+        """
+        if not text:
+            return 0
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def _select_route(self, diff: str, files: list[str]) -> Dict:
+        """
+        Pick a model tier and output cap by diff size and complexity
+
+        WHY file count too? Many small edits across files are harder to summarize
+        """
+        diff_tokens = self.estimate_tokens(diff)
+
+        if diff_tokens <= LITE_MAX_DIFF_TOKENS and len(files) <= 2:
+            tier = "lite"
+        elif diff_tokens <= STANDARD_MAX_DIFF_TOKENS and len(files) <= 15:
+            tier = "standard"
+        else:
+            tier = "pro"
+
+        config = MODEL_TIERS[tier]
+
+        return {
+            "tier": tier,
+            "model": config["model"],
+            "max_output_tokens": config["max_output_tokens"],
+            "max_diff_chars": config["max_diff_chars"],
+            "diff_tokens": diff_tokens,
+            "prompt_tokens": 0,
+            "estimated_cost": 0.0,
+            "fallback": False
+        }
+
+    def _build_prompt(self, diff: str, files: list[str], routing: Dict,
+                      style_instruction: Optional[str] = None) -> str:
+        """
+        Create the prompt and make it fit the per-request token budget
+
+        WHY? prompt + output cap must stay under GEMINI_MAX_REQUEST_TOKENS,
+        so a long file list is shortened and the diff gets whatever is left
+        """
+        budget = self.max_request_tokens - routing["max_output_tokens"]
+        style_suffix = f"\n\nSTYLE: {style_instruction}" if style_instruction else ""
+
+        # Halve the file list until the prompt without the diff fits
+        shown = len(files)
+        while True:
+            shown_files = files[:shown]
+            if shown < len(files):
+                shown_files = shown_files + [f"... and {len(files) - shown} more file(s)"]
+
+            overhead = self.estimate_tokens(
+                self._create_prompt("", shown_files, max_diff_chars=0) + style_suffix
+            )
+            if overhead < budget or shown == 0:
+                break
+            shown //= 2
+
+        diff_token_budget = budget - overhead
+        if diff_token_budget <= 0:
+            raise TokenBudgetError(
+                f"Prompt needs {overhead + routing['max_output_tokens']} tokens "
+                f"before the diff > {self.max_request_tokens} tokens/request"
+            )
+
+        routing["max_diff_chars"] = min(routing["max_diff_chars"], diff_token_budget * CHARS_PER_TOKEN)
+        prompt = self._create_prompt(diff, shown_files, max_diff_chars=routing["max_diff_chars"]) + style_suffix
+        routing["prompt_tokens"] = self.estimate_tokens(prompt)
+
+        # Should always hold after trimming, but never send an over-budget request
+        if routing["prompt_tokens"] + routing["max_output_tokens"] > self.max_request_tokens:
+            raise TokenBudgetError(
+                f"Request needs {routing['prompt_tokens'] + routing['max_output_tokens']} tokens "
+                f"> {self.max_request_tokens} tokens/request"
+            )
+
+        return prompt
+
+    def _response_text(self, response, max_output_tokens: int) -> str:
+        """
+        Get the response text, failing clearly when the output cap ran out
+
+        WHY not response.text? It raises a vague error when thinking used up
+        max_output_tokens and the candidate has no text part
+        """
+        if not response or not response.candidates:
+            raise Exception("Empty response from Gemini API")
+
+        candidate = response.candidates[0]
+        text = "".join(part.text for part in candidate.content.parts if part.text)
+
+        if not text:
+            if candidate.finish_reason == genai.protos.Candidate.FinishReason.MAX_TOKENS:
+                raise Exception(
+                    f"Gemini stopped at max_output_tokens ({max_output_tokens}) before writing any text"
+                )
+            # Can be empty if content is blocked or API error
+            raise Exception("Empty response from Gemini API")
+
+        return text
+
+    def _usage_tokens(self, response, estimated_prompt_tokens: int, response_text: str) -> tuple[int, int]:
+        """
+        Prompt and output tokens to bill, thinking included
+
+        WHY usage_metadata first? Thinking tokens cost money but never show up in the text
+        Returns: (prompt_tokens, output_tokens)
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage and usage.total_token_count:
+            prompt_tokens = usage.prompt_token_count
+            return prompt_tokens, max(0, usage.total_token_count - prompt_tokens)
+        return estimated_prompt_tokens, self.estimate_tokens(response_text)
+
+    def _get_model(self, model_name: str) -> genai.GenerativeModel:
+        """Get (or create) the GenerativeModel for a model name"""
+        if model_name not in self._models:
+            self._models[model_name] = genai.GenerativeModel(model_name)
+        return self._models[model_name]
+
+    def _reserve_tokens(self, tokens: int):
+        """
+        Count tokens against the per-minute budget
+
+        WHY raise? _generate turns it into the normal fallback message
+        Returns: a reservation to hand to _release_tokens if the request fails
+        """
+        if self.token_store is not None:
+            reservation = self.token_store.reserve_tokens(tokens, self.tokens_per_minute)
+            if reservation is None:
+                raise TokenBudgetError(
+                    f"Token budget exceeded: {tokens} more tokens > {self.tokens_per_minute} tokens/minute"
+                )
+            return reservation
+
+        now = time.monotonic()
+
+        # Drop requests older than one minute
+        while self._token_window and now - self._token_window[0][0] >= 60:
+            self._token_window.popleft()
+
+        used = sum(t for _, t in self._token_window)
+        if used + tokens > self.tokens_per_minute:
+            raise TokenBudgetError(
+                f"Token budget exceeded: {used + tokens} > {self.tokens_per_minute} tokens/minute"
+            )
+
+        reservation = (now, tokens)
+        self._token_window.append(reservation)
+        return reservation
+
+    def _settle_tokens(self, reservation, tokens: int):
+        """
+        Shrink a reservation to the tokens a successful request really used
+
+        Returns: the updated reservation
+        """
+        if self.token_store is not None:
+            # WHY catch? The message is already generated; a failed settle only
+            # means the budget stays charged for the full amount
+            try:
+                self.token_store.settle_tokens(reservation, tokens)
+            except Exception as e:
+                print(f"Token settle error: {e}")
+            return reservation
+
+        try:
+            index = self._token_window.index(reservation)
+        except ValueError:
+            return reservation  # Already dropped out of the one-minute window
+
+        settled = (reservation[0], tokens)
+        self._token_window[index] = settled
+        return settled
+
+    def _release_tokens(self, reservation):
+        """Give back tokens reserved for a request that failed"""
+        if self.token_store is not None:
+            self.token_store.release_tokens(reservation)
+            return
+
+        try:
+            self._token_window.remove(reservation)
+        except ValueError:
+            pass  # Already dropped out of the one-minute window
+
+    def _estimate_cost(self, tier: str, prompt_tokens: int, output_tokens: int) -> float:
+        """Estimate request cost in USD from the tier's per-1M-token prices"""
+        config = MODEL_TIERS[tier]
+        cost = (prompt_tokens * config["input_price"] + output_tokens * config["output_price"]) / 1_000_000
+        return round(cost, 8)
+
+    def _create_prompt(self, diff: str, files: list[str], max_diff_chars: int = 3000) -> str:
         """
         Create prompt for Gemini
 
         WHY structured prompt? Tells AI exactly what format we want
+        WHY max_diff_chars? Routing decides how much diff each tier gets
         """
         return f"""You are an expert at writing clear, concise git commit messages following conventional commits format.
 
@@ -89,7 +390,7 @@ Analyze this git diff and generate a commit message.
 
 **Diff:**
 ```
-{diff[:3000]}
+{diff[:max_diff_chars]}
 ```
 
 **Instructions:**
@@ -170,9 +471,4 @@ BODY: Implement JWT-based authentication with login and registration endpoints.
 
         style_instruction = styles.get(style, styles["concise"])
 
-        # Modify prompt with style
-        prompt = self._create_prompt(diff, files)
-        prompt += f"\n\nSTYLE: {style_instruction}"
-
-        response = self.model.generate_content(prompt)
-        return self._parse_response(response.text)
+        return self._generate(diff, files, style_instruction)
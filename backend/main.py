@@ -3,6 +3,7 @@ Main FastAPI application for Git Commit Message Composer
 WHY FastAPI? It's modern, fast, and has automatic API documentation
 """
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
@@ -34,9 +35,11 @@ app.add_middleware(
 )
 
 # Initialize services
+# WHY share db with GeminiService? With --workers N each process has its own
+# GeminiService, so the per-minute token budget has to live in the database
 git_analyzer = GitAnalyzer()
-gemini_service = GeminiService()
-db = Database()
+db = Database(os.getenv("DATABASE_PATH", "commit_history.db"))
+gemini_service = GeminiService(token_store=db)
 
 # Request/Response models - defines data structure
 class AnalyzeRequest(BaseModel):
@@ -76,10 +79,14 @@ async def analyze_changes(request: AnalyzeRequest):
         )
 
         # Step 3: Save to database for history
-        db.save_commit(
+        # WHY threadpool? A locked database can wait for seconds; that must
+        # not stall every other request on this worker's event loop
+        await run_in_threadpool(
+            db.save_commit,
             message=commit_message["message"],
             commit_type=commit_message["type"],
-            files=diff_data["files"]
+            files=diff_data["files"],
+            routing=commit_message.get("routing")
         )
 
         # Step 4: Return the result
@@ -95,8 +102,13 @@ async def analyze_changes(request: AnalyzeRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/history")
-async def get_history(limit: int = 10):
-    """Get recent commit message history"""
+def get_history(limit: int = 10):
+    """
+    Get recent commit message history
+
+    WHY plain def? FastAPI runs it in a threadpool, so waiting on a
+    database lock doesn't block the event loop
+    """
     try:
         history = db.get_recent_commits(limit)
         return {"history": history}
@@ -111,4 +123,13 @@ async def regenerate_message(request: AnalyzeRequest):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "8000"))
+    workers = int(os.getenv("WORKERS", "1"))
+
+    if workers > 1:
+        # WHY import string? uvicorn needs it to start each worker process
+        uvicorn.run("main:app", host=host, port=port, workers=workers)
+    else:
+        uvicorn.run(app, host=host, port=port)
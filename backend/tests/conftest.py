@@ -0,0 +1,45 @@
+"""
+Shared pytest setup
+WHY? The backend modules import each other as top-level modules (like main.py does)
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path to a fresh SQLite file"""
+    return str(tmp_path / "commit_history.db")
+
+
+@pytest.fixture
+def make_old_db(tmp_path):
+    """
+    Factory for databases with the commits table from before the routing columns
+
+    WHY a factory? Migration tests need several fresh old databases
+    """
+    def make(name: str = "old_history.db") -> str:
+        path = str(tmp_path / name)
+        with sqlite3.connect(path) as conn:
+            conn.execute("""
+                CREATE TABLE commits (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message TEXT NOT NULL,
+                    commit_type TEXT NOT NULL,
+                    files TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    used BOOLEAN DEFAULT FALSE
+                )
+            """)
+            conn.execute(
+                "INSERT INTO commits (message, commit_type, files) VALUES ('fix: old', 'fix', '[]')"
+            )
+        return path
+
+    return make
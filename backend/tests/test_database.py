@@ -0,0 +1,68 @@
+"""
+Tests for the SQLite history store
+"""
+from database import Database
+
+
+def test_migrates_old_commits_table(make_old_db):
+    db_path = make_old_db()
+    db = Database(db_path)
+
+    commits = db.get_recent_commits()
+    assert commits[0]["message"] == "fix: old"
+    assert commits[0]["model"] is None
+    assert commits[0]["fallback"] is False
+
+
+def test_save_commit_routing(db_path):
+    db = Database(db_path)
+    db.save_commit("fix: a", "fix", ["a.py"], {
+        "model": "models/gemini-2.5-flash-lite", "tier": "lite",
+        "prompt_tokens": 120, "estimated_cost": 0.00002, "fallback": False
+    })
+
+    row = db.get_recent_commits()[0]
+    assert row["model"] == "models/gemini-2.5-flash-lite"
+    assert row["routing_tier"] == "lite"
+    assert row["prompt_tokens"] == 120
+    assert row["fallback"] is False
+
+
+def test_save_commit_fallback_has_no_model(db_path):
+    db = Database(db_path)
+    db.save_commit("chore: update 1 file(s)", "chore", ["a.py"], {
+        "model": "models/gemini-2.5-pro", "tier": "pro",
+        "prompt_tokens": 5000, "estimated_cost": 0.0, "fallback": True
+    })
+
+    row = db.get_recent_commits()[0]
+    assert row["model"] is None
+    assert row["routing_tier"] == "pro"
+    assert row["fallback"] is True
+
+
+def test_reserve_and_release_tokens(db_path):
+    db = Database(db_path)
+
+    first = db.reserve_tokens(60, limit=100)
+    assert first is not None
+    assert db.reserve_tokens(60, limit=100) is None
+
+    db.release_tokens(first)
+    assert db.reserve_tokens(60, limit=100) is not None
+
+
+def test_reserve_tokens_window_expires(db_path):
+    db = Database(db_path)
+    assert db.reserve_tokens(100, limit=100, window_seconds=0) is not None
+    assert db.reserve_tokens(100, limit=100, window_seconds=0) is not None
+
+
+def test_settle_tokens(db_path):
+    db = Database(db_path)
+
+    reservation = db.reserve_tokens(90, limit=100)
+    db.settle_tokens(reservation, 30)
+
+    assert db.reserve_tokens(70, limit=100) is not None
+    assert db.reserve_tokens(1, limit=100) is None
@@ -0,0 +1,243 @@
+"""
+Tests for model routing, token budgets and fallbacks
+No network: models are replaced with fakes
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import google.generativeai as genai
+
+from gemini_service import GeminiService, MODEL_TIERS, LITE_MAX_DIFF_TOKENS, STANDARD_MAX_DIFF_TOKENS
+from database import Database
+
+GOOD_TEXT = "TYPE: fix\nSUBJECT: handle empty input\nBODY: "
+MAX_TOKENS = genai.protos.Candidate.FinishReason.MAX_TOKENS
+STOP = genai.protos.Candidate.FinishReason.STOP
+
+
+def make_response(text, finish_reason=STOP, usage=None):
+    parts = [SimpleNamespace(text=text)] if text else []
+    candidate = SimpleNamespace(content=SimpleNamespace(parts=parts), finish_reason=finish_reason)
+    return SimpleNamespace(candidates=[candidate], usage_metadata=usage)
+
+
+class FakeModel:
+    """Records prompts and returns a canned response"""
+
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls.append((prompt, generation_config))
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.delenv("GEMINI_MAX_REQUEST_TOKENS", raising=False)
+    monkeypatch.delenv("GEMINI_TOKENS_PER_MINUTE", raising=False)
+    return GeminiService()
+
+
+def use_fake(service, response):
+    """Make every tier answer with `response`"""
+    fake = FakeModel(response)
+    for config in MODEL_TIERS.values():
+        service._models[config["model"]] = fake
+    return fake
+
+
+def generate(service, diff, files):
+    return asyncio.run(service.generate_commit_message(diff, files))
+
+
+def test_estimate_tokens():
+    assert GeminiService.estimate_tokens(None) == 0
+    assert GeminiService.estimate_tokens("") == 0
+    assert GeminiService.estimate_tokens("abc") == 1
+    assert GeminiService.estimate_tokens("abcd") == 1
+    assert GeminiService.estimate_tokens("abcde") == 2
+
+
+@pytest.mark.parametrize("diff_tokens, file_count, tier", [
+    (LITE_MAX_DIFF_TOKENS, 2, "lite"),
+    (LITE_MAX_DIFF_TOKENS + 1, 2, "standard"),
+    (LITE_MAX_DIFF_TOKENS, 3, "standard"),
+    (STANDARD_MAX_DIFF_TOKENS, 15, "standard"),
+    (STANDARD_MAX_DIFF_TOKENS + 1, 1, "pro"),
+    (10, 16, "pro"),
+])
+def test_select_route_tiers(service, diff_tokens, file_count, tier):
+    routing = service._select_route("a" * diff_tokens * 4, [f"f{i}.py" for i in range(file_count)])
+    assert routing["tier"] == tier
+    assert routing["model"] == MODEL_TIERS[tier]["model"]
+    assert routing["max_output_tokens"] == MODEL_TIERS[tier]["max_output_tokens"]
+
+
+def test_estimate_cost(service):
+    assert service._estimate_cost("lite", 1_000_000, 0) == pytest.approx(0.10)
+    assert service._estimate_cost("pro", 1_000_000, 1_000_000) == pytest.approx(11.25)
+    assert service._estimate_cost("standard", 0, 0) == 0
+
+
+def test_generate_records_routing(service):
+    fake = use_fake(service, make_response(GOOD_TEXT))
+    result = generate(service, "+x = 1\n", ["a.py"])
+
+    assert result["message"] == "fix: handle empty input"
+    routing = result["routing"]
+    assert routing["tier"] == "lite"
+    assert routing["fallback"] is False
+    assert routing["prompt_tokens"] == service.estimate_tokens(fake.calls[0][0])
+    assert routing["estimated_cost"] > 0
+    assert fake.calls[0][1] == {"max_output_tokens": MODEL_TIERS["lite"]["max_output_tokens"]}
+
+
+def test_cost_uses_reported_usage(service):
+    # 1000 output tokens, mostly thinking that never shows up in the text
+    usage = SimpleNamespace(prompt_token_count=100, total_token_count=1100)
+    use_fake(service, make_response(GOOD_TEXT, usage=usage))
+
+    result = generate(service, "+x = 1\n", ["a.py"])
+
+    assert result["routing"]["prompt_tokens"] == 100
+    assert result["routing"]["estimated_cost"] == service._estimate_cost("lite", 100, 1000)
+
+
+@pytest.mark.parametrize("extra_chars, tier", [(0, "standard"), (1, "pro")])
+def test_routing_boundary_shows_whole_diff(service, extra_chars, tier):
+    fake = use_fake(service, make_response(GOOD_TEXT))
+    diff = "a" * (STANDARD_MAX_DIFF_TOKENS * 4 - 1) + "Z" * (1 + extra_chars)
+
+    result = generate(service, diff, ["a.py"])
+
+    assert result["routing"]["tier"] == tier
+    assert diff in fake.calls[0][0]
+
+
+def test_successful_calls_settle_reservation(service):
+    # Budget only fits one reservation of the full standard output cap...
+    service.tokens_per_minute = MODEL_TIERS["standard"]["max_output_tokens"] + 2000
+    usage = SimpleNamespace(prompt_token_count=300, total_token_count=350)
+    use_fake(service, make_response(GOOD_TEXT, usage=usage))
+    files = ["a.py", "b.py", "c.py"]
+
+    # ...but each small reply only uses 350 tokens of it
+    for _ in range(5):
+        result = generate(service, "+x = 1\n", files)
+        assert result["routing"]["tier"] == "standard"
+        assert result["routing"]["fallback"] is False
+
+    assert [tokens for _, tokens in service._token_window] == [350] * 5
+
+
+def test_settle_without_usage_uses_estimate(service):
+    fake = use_fake(service, make_response(GOOD_TEXT))
+    generate(service, "+x = 1\n", ["a.py"])
+
+    expected = service.estimate_tokens(fake.calls[0][0]) + service.estimate_tokens(GOOD_TEXT)
+    assert [tokens for _, tokens in service._token_window] == [expected]
+
+
+def test_request_budget_shortens_file_list(service):
+    service.max_request_tokens = MODEL_TIERS["pro"]["max_output_tokens"] + 2000
+    fake = use_fake(service, make_response(GOOD_TEXT))
+    files = [f"src/module_{i}/file_{i}.py" for i in range(2000)]
+
+    result = generate(service, "+x = 1\n" * 50, files)
+
+    assert result["routing"]["fallback"] is False
+    prompt = fake.calls[0][0]
+    assert "more file(s)" in prompt
+    assert "+x = 1" in prompt
+    assert result["routing"]["prompt_tokens"] + result["routing"]["max_output_tokens"] <= service.max_request_tokens
+
+
+def test_request_budget_too_small_falls_back(service):
+    service.max_request_tokens = MODEL_TIERS["lite"]["max_output_tokens"] + 10
+    fake = use_fake(service, make_response(GOOD_TEXT))
+
+    result = generate(service, "+x = 1\n", ["a.py"])
+
+    assert fake.calls == []
+    assert result["routing"]["fallback"] is True
+    assert result["type"] == "chore"
+
+
+def test_max_tokens_without_text_falls_back(service):
+    use_fake(service, make_response("", finish_reason=MAX_TOKENS))
+    result = generate(service, "+x = 1\n", ["a.py"])
+    assert result["routing"]["fallback"] is True
+    assert result["routing"]["estimated_cost"] == 0
+
+
+def test_minute_budget_falls_back_and_failed_calls_release(service):
+    use_fake(service, RuntimeError("API down"))
+    service.tokens_per_minute = MODEL_TIERS["lite"]["max_output_tokens"] + 1000
+
+    # Failed calls give their tokens back, so the budget never fills up
+    for _ in range(3):
+        assert generate(service, "+x = 1\n", ["a.py"])["routing"]["fallback"] is True
+    assert list(service._token_window) == []
+
+    use_fake(service, make_response(GOOD_TEXT))
+    assert generate(service, "+x = 1\n", ["a.py"])["routing"]["fallback"] is False
+    assert len(service._token_window) == 1
+
+    # No room left for another full output cap
+    service.tokens_per_minute = service._token_window[0][1]
+    assert generate(service, "+x = 1\n", ["a.py"])["routing"]["fallback"] is True
+
+
+def test_shared_token_store(service, db_path):
+    db = Database(db_path)
+    service.token_store = db
+    service.tokens_per_minute = MODEL_TIERS["lite"]["max_output_tokens"] + 1000
+
+    # Failed calls give their reservation back
+    use_fake(service, RuntimeError("API down"))
+    generate(service, "+x = 1\n", ["a.py"])
+    assert db.reserve_tokens(service.tokens_per_minute, service.tokens_per_minute) is not None
+
+
+def test_shared_token_store_settles(service, db_path):
+    db = Database(db_path)
+    service.token_store = db
+    service.tokens_per_minute = MODEL_TIERS["lite"]["max_output_tokens"] + 1000
+    usage = SimpleNamespace(prompt_token_count=100, total_token_count=150)
+    use_fake(service, make_response(GOOD_TEXT, usage=usage))
+
+    # Each call reserves the full output cap, but only 150 tokens stay charged
+    for _ in range(5):
+        assert generate(service, "+x = 1\n", ["a.py"])["routing"]["fallback"] is False
+
+    assert db.reserve_tokens(service.tokens_per_minute - 5 * 150, service.tokens_per_minute) is not None
+
+
+def test_release_error_still_falls_back(service, monkeypatch):
+    use_fake(service, RuntimeError("API down"))
+
+    def broken_release(reservation):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(service, "_release_tokens", broken_release)
+    result = generate(service, "+x = 1\n", ["a.py"])
+
+    assert result["routing"]["fallback"] is True
+
+
+def test_regenerate_with_style_falls_back(service):
+    service.tokens_per_minute = 0
+    result = service.regenerate_with_style("+x = 1\n", ["a.py"], "emoji")
+    assert result["routing"]["fallback"] is True
+
+
+def test_regenerate_with_style_adds_style(service):
+    fake = use_fake(service, make_response(GOOD_TEXT))
+    service.regenerate_with_style("+x = 1\n", ["a.py"], "emoji")
+    assert fake.calls[0][0].endswith("STYLE: Use relevant emojis in the message")
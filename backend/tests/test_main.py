@@ -0,0 +1,68 @@
+"""
+Tests for the API endpoints
+"""
+import asyncio
+import importlib
+import inspect
+import sys
+import time
+
+import pytest
+
+from gemini_service import MODEL_TIERS
+from test_gemini_service import FakeModel, GOOD_TEXT, make_response
+
+
+@pytest.fixture
+def main(monkeypatch, db_path):
+    """Fresh import of main against a temporary database"""
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("DATABASE_PATH", db_path)
+    sys.modules.pop("main", None)
+    module = importlib.import_module("main")
+
+    fake = FakeModel(make_response(GOOD_TEXT))
+    for config in MODEL_TIERS.values():
+        module.gemini_service._models[config["model"]] = fake
+    monkeypatch.setattr(module.git_analyzer, "get_staged_changes", lambda repo_path: {
+        "has_changes": True, "diff": "+x = 1\n", "files": ["a.py"],
+        "insertions": 1, "deletions": 0
+    })
+
+    yield module
+    sys.modules.pop("main", None)
+
+
+def test_history_runs_in_threadpool(main):
+    assert not inspect.iscoroutinefunction(main.get_history)
+
+
+def test_slow_database_does_not_block_event_loop(main, monkeypatch):
+    save_commit = main.db.save_commit
+
+    def slow_save_commit(*args, **kwargs):
+        time.sleep(0.5)  # Like waiting on another worker's lock
+        return save_commit(*args, **kwargs)
+
+    monkeypatch.setattr(main.db, "save_commit", slow_save_commit)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        response = await main.analyze_changes(main.AnalyzeRequest())
+        ticking.cancel()
+        return response, ticks
+
+    response, ticks = asyncio.run(scenario())
+
+    assert response.message == "fix: handle empty input"
+    assert main.db.get_recent_commits()[0]["message"] == "fix: handle empty input"
+    # A blocked loop would tick once or twice at most
+    assert ticks > 10
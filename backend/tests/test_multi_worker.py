@@ -0,0 +1,147 @@
+"""
+Tests for running several worker processes against one database
+Each "worker" is a separate Python process, like `uvicorn --workers N`
+"""
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+import database
+from database import Database, retry_on_lock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_processes(code, count, *args):
+    """Start `count` Python processes at once and return their outputs"""
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", code, *map(str, args)],
+            cwd=BACKEND_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        for _ in range(count)
+    ]
+    results = [process.communicate(timeout=60) for process in processes]
+    for process, (_, stderr) in zip(processes, results):
+        assert process.returncode == 0, stderr
+    return [stdout for stdout, _ in results]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_concurrent_migration(make_old_db):
+    # Several rounds, since a race doesn't show up every time
+    for round_number in range(5):
+        db_path = make_old_db(f"round_{round_number}.db")
+
+        run_processes("import sys; from database import Database; Database(sys.argv[1])", 6, db_path)
+
+        commits = Database(db_path).get_recent_commits()
+        assert commits[0]["message"] == "fix: old"
+        assert commits[0]["fallback"] is False
+
+
+def test_reserve_tokens_shared_across_processes(db_path):
+    Database(db_path)
+    code = (
+        "import sys; from database import Database\n"
+        "db = Database(sys.argv[1])\n"
+        "print(sum(db.reserve_tokens(10, 500) is not None for _ in range(40)))"
+    )
+
+    outputs = run_processes(code, 6, db_path)
+
+    # 6 x 40 attempts of 10 tokens, but only 500 tokens per minute in total
+    assert sum(int(output) for output in outputs) == 50
+
+
+def test_retry_on_lock_retries_locked(monkeypatch):
+    monkeypatch.setattr(database.time, "sleep", lambda seconds: None)
+    calls = []
+
+    @retry_on_lock
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError("database is locked")
+        return "ok"
+
+    assert flaky() == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_on_lock_gives_up(monkeypatch):
+    monkeypatch.setattr(database.time, "sleep", lambda seconds: None)
+    calls = []
+
+    @retry_on_lock
+    def always_locked():
+        calls.append(1)
+        raise sqlite3.OperationalError("database is locked")
+
+    with pytest.raises(sqlite3.OperationalError):
+        always_locked()
+    assert len(calls) == database.LOCK_RETRIES + 1
+
+
+def test_retry_on_lock_reraises_other_errors(monkeypatch):
+    monkeypatch.setattr(database.time, "sleep", lambda seconds: None)
+    calls = []
+
+    @retry_on_lock
+    def broken():
+        calls.append(1)
+        raise sqlite3.OperationalError("no such table: commits")
+
+    with pytest.raises(sqlite3.OperationalError, match="no such table"):
+        broken()
+    assert len(calls) == 1
+
+
+def test_startup_with_multiple_workers(make_old_db):
+    db_path = make_old_db()
+    port = free_port()
+
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_API_KEY": "test-key",
+        "DATABASE_PATH": db_path,
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "WORKERS": "2",
+    })
+    server = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+
+    try:
+        history = None
+        deadline = time.time() + 30
+        while time.time() < deadline and history is None:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/history", timeout=2) as response:
+                    history = response.read().decode()
+            except OSError:
+                assert server.poll() is None, "server exited during startup"
+                time.sleep(0.2)
+
+        assert history is not None, "server did not answer"
+        assert "fix: old" in history
+
+    finally:
+        server.terminate()
+        output, _ = server.communicate(timeout=30)
+
+    # One "Started server process" line per worker
+    assert output.count("Started server process") == 2, output